@@ -1,24 +1,38 @@
-from web3 import Web3
-from eth_account import Account
-
-# Disable user-friendly warnings
-# This function is used to enable features that are not yet audited
-# and are intended for specific use cases like generating new accounts
-# from a mnemonic phrase.
-Account.enable_unaudited_hdwallet_features()
-
-# This generates a new private key and address
-# `Account.create()` generates a new, random Ethereum account object.
-# `._private_key.hex()` extracts the private key from the account object
-# and converts it into a hexadecimal string. This is the secret key
-# used to sign transactions.
-private_key = Account.create()._private_key.hex()
-
-# `Account.from_key(private_key)` recreates the account object using
-# the private key.
-# `.address` extracts the public address associated with that private key.
+from coincurve import PrivateKey
+from Crypto.Hash import keccak
+
+
+def keccak256(data):
+    # Ethereum uses the original Keccak-256, not the finalized SHA3-256.
+    return keccak.new(digest_bits=256, data=data).digest()
+
+
+def to_checksum_address(address_hex):
+    # EIP-55: uppercase each hex letter whose matching nibble in the
+    # keccak hash of the lowercase address is 8 or higher.
+    address_hash = keccak256(address_hex.encode("ascii")).hex()
+    return "0x" + "".join(
+        char.upper() if int(address_hash[i], 16) >= 8 else char
+        for i, char in enumerate(address_hex)
+    )
+
+
+# This generates a new private key using libsecp256k1 (through coincurve).
+# `PrivateKey()` draws 32 random bytes from the OS CSPRNG and checks that
+# they form a valid secp256k1 scalar.
+# `.secret.hex()` converts the raw secret into a hexadecimal string. This is
+# the secret key used to sign transactions.
+key = PrivateKey()
+private_key = "0x" + key.secret.hex()
+
+# The public key is derived once from the private key object.
+# `format(compressed=False)` returns 65 bytes: a 0x04 prefix followed by the
+# X and Y coordinates. The prefix is dropped before hashing.
+public_key = key.public_key.format(compressed=False)[1:]
+
+# The address is the last 20 bytes of the keccak256 hash of the public key.
 # This address is what you share with others to receive funds.
-public_address = Account.from_key(private_key).address
+public_address = to_checksum_address(keccak256(public_key)[-20:].hex())
 
 # Print the generated private key and public address
 # The private key should be kept secret as it controls the account.
@@ -28,4 +42,3 @@ print(private_key)
 # The public address is safe to share.
 print("\nNew Testnet Public Address:")
 print(public_address)
-
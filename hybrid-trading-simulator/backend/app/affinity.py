@@ -0,0 +1,45 @@
+# Helpers to pin a process to dedicated CPU cores. Keeping the API workers and
+# the settlement worker on their own cores stops them from migrating between
+# cores and evicting each other's data from the CPU caches.
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_core_list(value: str) -> set:
+    """
+    Parses a core list such as "2", "2,3" or "2-4" into a set of core ids.
+    """
+    cores = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cores.update(range(int(start), int(end) + 1))
+        else:
+            cores.add(int(part))
+    return cores
+
+def pin_to_cores_from_env(env_var: str = "WORKER_CORE"):
+    """
+    Pins the current process to the cores listed in `env_var`.
+    Does nothing if the variable is unset or empty, or if the platform does
+    not support CPU affinity (e.g. macOS or Windows).
+    """
+    value = os.getenv(env_var, "").strip()
+    if not value:
+        return
+
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("%s is set but CPU affinity is not supported on this platform. Ignoring.", env_var)
+        return
+
+    try:
+        cores = parse_core_list(value)
+        os.sched_setaffinity(0, cores)
+        logger.info("Process %s pinned to cores %s.", os.getpid(), sorted(cores))
+    except (ValueError, OSError) as e:
+        logger.error("Could not pin process to cores '%s' from %s: %s", value, env_var, e, exc_info=True)
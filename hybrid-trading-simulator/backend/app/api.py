@@ -3,14 +3,17 @@
 # as well as a WebSocket endpoint for real-time market data updates.
 
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import time
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 import logging
+import msgpack
+import orjson
+from .affinity import pin_to_cores_from_env
 from .dependencies import db, get_rabbitmq_channel
 from .matching_engine import Order, order_books
-# from binance import AsyncWebsocketStreamManager # Uncomment if you want live Binance data
 
 # Configure basic logging for a clear record of application events and errors.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,10 +25,12 @@ app = FastAPI()
 # Configure CORS (Cross-Origin Resource Sharing) to allow the frontend
 # application (e.g., a React app running on localhost:3000) to
 # communicate with this backend API. This is crucial for web development.
-origins = [
+# The origins are kept in a frozenset, so checking a request's origin is a
+# single set lookup, and no regex is configured.
+origins = frozenset([
     "http://localhost:3000",  # React app development server
     "http://127.0.0.1:3000",
-]
+])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -34,9 +39,22 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Dictionary to store active WebSocket connections. The key is a unique
-# identifier for the client (e.g., "host:port") and the value is the WebSocket object.
-active_connections: Dict[str, WebSocket] = {}
+# Set of active WebSocket connections. The WebSocket object itself is the key,
+# so no per-client identifier has to be built on connect or disconnect.
+active_connections: Set[WebSocket] = set()
+
+# Cache of serialized order book snapshots. The key is the trading pair and the
+# value is a (timestamp, JSON bytes) tuple. Entries older than SNAPSHOT_TTL
+# seconds are rebuilt on the next request; the broadcaster refreshes the
+# broadcast pair on every tick.
+SNAPSHOT_TTL = 0.1
+_snapshot_cache: Dict[str, Tuple[float, bytes]] = {}
+EMPTY_ORDER_BOOK = orjson.dumps({"bids": [], "asks": []})
+
+# Message type sent in the "t" field of the msgpack encoded WebSocket frames.
+MSG_ORDERBOOK_UPDATE = 1
+# Frame broadcast while the pair has no order book, packed once up front.
+EMPTY_ORDERBOOK_FRAME = msgpack.packb({"t": MSG_ORDERBOOK_UPDATE, "b": [], "a": []})
 
 # Pydantic model to define the structure of the order book data
 # that will be returned by the API. This ensures data consistency.
@@ -53,7 +71,10 @@ class OrderBookData(BaseModel):
 # which is a Pydantic model for data validation.
 @app.post("/api/v1/order")
 async def place_order(order: Order):
-    logger.info(f"Received new order: {order.dict()}")
+    logger.info("Received new order %s for pair %s.", order.order_id, order.pair)
+    # Dumping the full order is only worth the cost when debug logging is on.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Order details: %s", orjson.dumps(order.model_dump(mode='json')).decode())
     # TODO: Add more robust user authentication and balance checks here
     # A real-world application would need to verify the user's identity and
     # ensure they have sufficient funds before processing the order.
@@ -61,7 +82,7 @@ async def place_order(order: Order):
     # Retrieve the correct order book for the specified trading pair (e.g., "BTC-USD").
     order_book = order_books.get(order.pair)
     if not order_book:
-        logger.warning(f"Invalid trading pair '{order.pair}' requested for order.")
+        logger.warning("Invalid trading pair '%s' requested for order.", order.pair)
         # If the pair doesn't exist, return a 400 Bad Request error.
         raise HTTPException(status_code=400, detail="Invalid trading pair")
     
@@ -80,100 +101,145 @@ async def place_order(order: Order):
     try:
         # Add the validated order to the matching engine's order book.
         await order_book.add_order(order)
-        logger.info(f"Order {order.order_id} for pair {order.pair} submitted successfully.")
+        logger.info("Order %s for pair %s submitted successfully.", order.order_id, order.pair)
         # Return a success message and the order's unique ID.
         return {"message": "Order submitted successfully", "order_id": order.order_id}
     except Exception as e:
         # Catch any unexpected errors during order processing and log them.
-        logger.error(f"Failed to add order {order.order_id} to the order book: {e}", exc_info=True)
+        logger.error("Failed to add order %s to the order book: %s", order.order_id, e, exc_info=True)
         # Return a 500 Internal Server Error to the client.
         raise HTTPException(status_code=500, detail="Internal server error while processing order.")
 
-# Endpoint to get the current state of a specific trading pair's order book.
-@app.get("/api/v1/orderbook/{pair}", response_model=OrderBookData)
-async def get_order_book_endpoint(pair: str):
-    logger.info(f"Fetching order book for pair: {pair}")
+# Fetches the current order book for a pair and stores its serialized form in
+# the snapshot cache. Returns None if the pair is unknown.
+async def refresh_order_book_snapshot(pair: str) -> Optional[dict]:
     order_book = order_books.get(pair)
     if not order_book:
-        logger.warning(f"Order book for pair '{pair}' not found. Returning empty data.")
-        # If no order book exists for the pair, return an empty set of bids and asks.
-        return {"bids": [], "asks": []}
-    
+        return None
+
     # Call the method on the order book object to get the current data.
     data = await order_book.get_order_book_data()
-    logger.info(f"Successfully fetched order book data for {pair}.")
+    _snapshot_cache[pair] = (time.monotonic(), orjson.dumps(data))
     return data
 
+# Returns the serialized order book for a pair, reusing the cached snapshot
+# while it is younger than SNAPSHOT_TTL. Returns None if the pair is unknown.
+async def get_order_book_snapshot(pair: str) -> Optional[bytes]:
+    entry = _snapshot_cache.get(pair)
+    if not entry or time.monotonic() - entry[0] >= SNAPSHOT_TTL:
+        if await refresh_order_book_snapshot(pair) is None:
+            return None
+        entry = _snapshot_cache[pair]
+    return entry[1]
+
+# Endpoint to get the current state of a specific trading pair's order book.
+# The cached JSON bytes are returned as they are; `OrderBookData` is only used
+# to document the response schema, so the data is not validated again.
+@app.get("/api/v1/orderbook/{pair}", responses={200: {"model": OrderBookData}})
+async def get_order_book_endpoint(pair: str):
+    logger.info("Fetching order book for pair: %s", pair)
+    snapshot = await get_order_book_snapshot(pair)
+    if snapshot is None:
+        logger.warning("Order book for pair '%s' not found. Returning empty data.", pair)
+        # If no order book exists for the pair, return an empty set of bids and asks.
+        return Response(EMPTY_ORDER_BOOK, media_type="application/json")
+
+    logger.info("Successfully fetched order book data for %s.", pair)
+    return Response(snapshot, media_type="application/json")
+
+# Closes a WebSocket so its socket is released right away instead of waiting
+# for garbage collection. Closing an already closed socket is ignored.
+async def close_websocket(websocket: WebSocket):
+    try:
+        await websocket.close()
+    except RuntimeError:
+        pass
+
+# Background task that builds the market data snapshot once per tick and
+# fans the same serialized payload out to every connected client. This keeps
+# the per-client cost down to a single send, no matter how many clients are
+# connected. Frames are msgpack encoded as {"t": type, "b": bids, "a": asks},
+# which is considerably smaller than the equivalent JSON text.
+async def snapshot_broadcaster():
+    # Note: The current implementation only broadcasts data for "BTC-USD".
+    # A more advanced system might allow the client to specify which pair
+    # they want to subscribe to.
+    pair_to_fetch = "BTC-USD"
+    logger.info("Starting order book broadcaster for %s.", pair_to_fetch)
+    while True:
+        try:
+            if active_connections:
+                # Rebuild the snapshot on every tick; this also refreshes the REST cache.
+                # The order book is read directly rather than through the REST handler.
+                data = await refresh_order_book_snapshot(pair_to_fetch)
+                # Serialize once and reuse the same bytes for every client.
+                if data is None:
+                    payload = EMPTY_ORDERBOOK_FRAME
+                else:
+                    payload = msgpack.packb({"t": MSG_ORDERBOOK_UPDATE, "b": data["bids"], "a": data["asks"]})
+                # Take a copy of the connections, as clients may disconnect while we are sending.
+                clients = list(active_connections)
+                results = await asyncio.gather(
+                    *(ws.send_bytes(payload) for ws in clients),
+                    return_exceptions=True,
+                )
+                # Drop and close the clients that could not be sent to.
+                failed = [ws for ws, result in zip(clients, results) if isinstance(result, Exception)]
+                for ws in failed:
+                    active_connections.discard(ws)
+                    logger.warning("Error sending to WebSocket %s. Closing connection.", ws.client)
+                await asyncio.gather(*(close_websocket(ws) for ws in failed))
+                logger.debug("Broadcast order book update for %s to %s clients.", pair_to_fetch, len(active_connections))
+        except Exception as e:
+            # Never let a single failed tick stop the broadcaster.
+            logger.error("Error while broadcasting order book for %s: %s", pair_to_fetch, e, exc_info=True)
+
+        # Pause for one second before sending the next update.
+        await asyncio.sleep(1)
+
+# Pin the worker to its dedicated cores (if WORKER_CORE is set).
+@app.on_event("startup")
+async def pin_worker_cores():
+    pin_to_cores_from_env()
+
+# Start the broadcaster together with the application.
+@app.on_event("startup")
+async def start_snapshot_broadcaster():
+    # Keep a reference to the task so it isn't garbage collected while running.
+    app.state.snapshot_broadcaster_task = asyncio.create_task(snapshot_broadcaster())
+
 # Real-time WebSocket endpoint for market data updates.
 # This allows clients to receive live data without repeatedly polling the API.
+# Updates are pushed by `snapshot_broadcaster`; this handler only registers the
+# client and waits for it to go away.
 @app.websocket("/ws/marketdata")
 async def websocket_endpoint(websocket: WebSocket):
-    # Create a unique key for the client based on their IP and port.
-    client_key = f"{websocket.client.host}:{websocket.client.port}"
-    logger.info(f"Attempting to accept WebSocket connection for client: {client_key}")
+    # The client address is only read when something is actually logged.
+    logger.info("Attempting to accept WebSocket connection for client: %s", websocket.client)
     try:
         # Accept the incoming WebSocket connection.
         await websocket.accept()
-        # Store the connection in the dictionary of active connections.
-        active_connections[client_key] = websocket
-        logger.info(f"Client {client_key} connected to WebSocket.")
+        # Store the connection in the set of active connections.
+        active_connections.add(websocket)
+        logger.info("Client %s connected to WebSocket.", websocket.client)
     except Exception as e:
-        logger.error(f"Failed to accept WebSocket connection for {client_key}: {e}", exc_info=True)
+        logger.error("Failed to accept WebSocket connection for %s: %s", websocket.client, e, exc_info=True)
         return
 
     try:
-        # The main loop for the WebSocket connection.
+        # Block on incoming messages so a disconnect is detected straight away.
+        # Anything the client sends is currently ignored.
         while True:
-            # Note: The current implementation only fetches data for "BTC-USD".
-            # A more advanced system might allow the client to specify which pair
-            # they want to subscribe to.
-            pair_to_fetch = "BTC-USD"
-            logger.debug(f"Fetching and sending order book update for {pair_to_fetch} to client {client_key}.")
-            
-            # Fetch the latest order book data via the existing API function.
-            order_book_data = await get_order_book_endpoint(pair=pair_to_fetch)
-            
-            try:
-                # Send the data to the connected client as a JSON message.
-                await websocket.send_json({"type": "orderbook_update", "data": order_book_data.dict()})
-                logger.debug(f"Successfully sent update to client {client_key}.")
-            except RuntimeError as e:
-                # Handle cases where the connection is no longer active.
-                logger.warning(f"Error sending to WebSocket {client_key}: {e}. Connection may be closed.")
-                break
-            
-            # Pause for one second before sending the next update.
-            await asyncio.sleep(1)
+            await websocket.receive_text()
     except WebSocketDisconnect:
         # This exception is raised when the client gracefully closes the connection.
-        # Remove the disconnected client from the active connections dictionary.
-        del active_connections[client_key]
-        logger.info(f"Client {client_key} disconnected from WebSocket.")
+        # Remove the disconnected client from the active connections set.
+        active_connections.discard(websocket)
+        logger.info("Client %s disconnected from WebSocket.", websocket.client)
     except Exception as e:
         # Catch any other unexpected errors and log them.
-        logger.error(f"Unexpected error in WebSocket {client_key}: {e}", exc_info=True)
-        if client_key in active_connections:
-            # Ensure the connection is removed from the active connections list.
-            del active_connections[client_key]
-
-# Optional: Binance live data stream integration.
-# This section is commented out but provides a blueprint for integrating with
-# a live external data source like Binance to provide real-time pricing.
-# It uses the `AsyncWebsocketStreamManager` to listen for ticker updates.
-# The data received from Binance could then be used to inform trades or
-# provide more dynamic pricing.
-# async def binance_live_stream():
-#     logger.info("Starting Binance stream placeholder.")
-#     ... (code for managing the stream) ...
-#     while True:
-#         logger.debug("Binance stream placeholder running...")
-#         await asyncio.sleep(5)
-
-# This event handler would be used to start background tasks, such as the
-# Binance data stream, when the application starts up.
-# @app.on_event("startup")
-# async def startup_event():
-#     logger.info("Application startup event triggered.")
-#     # Uncomment to enable Binance stream
-#     # asyncio.create_task(binance_live_stream())
-#     pass
\ No newline at end of file
+        logger.error("Unexpected error in WebSocket %s: %s", websocket.client, e, exc_info=True)
+        # Ensure the connection is removed from the active connections set
+        # and the underlying socket is closed.
+        active_connections.discard(websocket)
+        await close_websocket(websocket)
@@ -1,9 +1,23 @@
 import os
 import asyncio
 import json
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from decimal import Context, Decimal, DecimalException
+import msgspec
 from web3 import Web3, HTTPProvider
+from web3.exceptions import TransactionNotFound
 import aio_pika
+import requests
+# uvloop is not available on Windows; the default asyncio loop is used there.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 from dotenv import load_dotenv
+from .affinity import pin_to_cores_from_env
 import logging
 
 # Configure logging for the script to provide visibility into its operations.
@@ -20,17 +34,56 @@ ETH_TESTNET_URL = os.getenv("ETH_TESTNET_URL")
 SETTLEMENT_CONTRACT_ADDRESS = os.getenv("SETTLEMENT_CONTRACT_ADDRESS")
 SETTLEMENT_CONTRACT_ABI_STR = os.getenv("SETTLEMENT_CONTRACT_ABI")
 RABBITMQ_URI = os.getenv("RABBITMQ_URI")
+# Private key of the account that signs settlement transactions.
+PRIVATE_KEY = os.getenv("PRIVATE_KEY")
+# Send real settleTrade transactions instead of simulating them.
+ONCHAIN_SETTLEMENT = os.getenv("ONCHAIN_SETTLEMENT", "false").lower() == "true"
+# Gas limit used for settleTrade transactions, so no gas estimate call is needed per trade.
+SETTLEMENT_GAS_LIMIT = int(os.getenv("SETTLEMENT_GAS_LIMIT", "200000"))
+# How long to wait for a settlement transaction to be mined, and how often to
+# poll the node for its receipt, in seconds.
+SETTLEMENT_RECEIPT_TIMEOUT = float(os.getenv("SETTLEMENT_RECEIPT_TIMEOUT", "300"))
+SETTLEMENT_RECEIPT_POLL_INTERVAL = float(os.getenv("SETTLEMENT_RECEIPT_POLL_INTERVAL", "2"))
+# Optional fixed EIP-1559 fees (in wei) for settleTrade transactions. When both
+# are set, no fee lookups are made per trade; otherwise they are read from the node.
+SETTLEMENT_MAX_FEE_PER_GAS = os.getenv("SETTLEMENT_MAX_FEE_PER_GAS")
+SETTLEMENT_MAX_PRIORITY_FEE_PER_GAS = os.getenv("SETTLEMENT_MAX_PRIORITY_FEE_PER_GAS")
 # Define the name of the queue to consume messages from.
 QUEUE_NAME = "trade_settlement_queue"
+# Wei is the smallest unit of Ether (1 ETH = 10^18 wei).
+WEI_DECIMALS = 18
+# Largest value a uint256 contract argument can hold.
+MAX_UINT256 = 2**256 - 1
+# Decimal context for the wei conversion. Any uint256 fits in 78 digits, so
+# 100 digits keep every whole wei exact; only inputs with more than 100
+# significant digits are rounded, and that can only change sub-wei digits
+# (or, at most, the last wei when they round up).
+WEI_CONTEXT = Context(prec=100)
+# Number of unacknowledged messages RabbitMQ may deliver to this worker at once.
+PREFETCH_COUNT = 64
+# Maximum number of trades that are settled at the same time.
+MAX_CONCURRENT_SETTLEMENTS = 32
+# Message bodies larger than this (in bytes) are decoded in a worker thread
+# so they don't hold up the event loop.
+LARGE_MESSAGE_BYTES = 64 * 1024
 
 # Validate that all necessary environment variables are present.
 if not all([ETH_TESTNET_URL, SETTLEMENT_CONTRACT_ADDRESS, SETTLEMENT_CONTRACT_ABI_STR, RABBITMQ_URI]):
     logger.error("Missing one or more required environment variables for consumer. Exiting.")
     exit(1)
+if ONCHAIN_SETTLEMENT and not PRIVATE_KEY:
+    logger.error("ONCHAIN_SETTLEMENT is enabled but PRIVATE_KEY is not set. Exiting.")
+    exit(1)
 
 # Connect to the Ethereum testnet using the provided URL.
-logger.info(f"Connecting to Ethereum testnet URL: {ETH_TESTNET_URL}")
-w3 = Web3(HTTPProvider(ETH_TESTNET_URL))
+logger.info("Connecting to Ethereum testnet URL: %s", ETH_TESTNET_URL)
+# Settlement transactions are sent from worker threads, so the HTTP session
+# keeps one pooled connection per concurrent settlement.
+rpc_session = requests.Session()
+rpc_adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_CONCURRENT_SETTLEMENTS)
+rpc_session.mount("http://", rpc_adapter)
+rpc_session.mount("https://", rpc_adapter)
+w3 = Web3(HTTPProvider(ETH_TESTNET_URL, session=rpc_session))
 if w3.is_connected():
     logger.info("Successfully connected to Ethereum testnet.")
 else:
@@ -47,103 +100,376 @@ except json.JSONDecodeError:
 
 # Create a contract instance using the address and ABI. This allows the script
 # to call functions on the smart contract.
-logger.info(f"Loading settlement contract at address: {SETTLEMENT_CONTRACT_ADDRESS}")
+logger.info("Loading settlement contract at address: %s", SETTLEMENT_CONTRACT_ADDRESS)
 settlement_contract = w3.eth.contract(address=SETTLEMENT_CONTRACT_ADDRESS, abi=SETTLEMENT_CONTRACT_ABI)
 
+class NonceManager:
+    """
+    Hands out transaction nonces for a single sender from a local counter.
+    The counter is read from the node once and then incremented locally, so
+    sending a transaction doesn't need an extra RPC call to fetch the nonce.
+    It is safe to use from several worker threads.
+
+    Nonces whose transaction never reached the node are handed back with
+    `release_if_unused` and reused before new ones, so a failed send leaves no
+    gap that would stall later transactions. The counter itself is never reset
+    while running, as other threads may still hold nonces they haven't sent.
+    """
+    def __init__(self, address: str):
+        self.address = address
+        self._next_nonce = None
+        self._released = []
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """
+        Loads the nonce from the node, including pending transactions.
+        Only call this at startup, before any nonce has been handed out.
+        """
+        with self._lock:
+            self._next_nonce = w3.eth.get_transaction_count(self.address, "pending")
+            self._released.clear()
+        logger.info("Nonce for %s synced to %s.", self.address, self._next_nonce)
+
+    def next(self) -> int:
+        """
+        Returns the nonce for the next transaction, preferring released ones.
+        """
+        with self._lock:
+            if self._released:
+                return heapq.heappop(self._released)
+            nonce = self._next_nonce
+            self._next_nonce += 1
+        return nonce
+
+    def release_if_unused(self, nonce: int):
+        """
+        Hands a nonce back after a failed send, unless the node has used it.
+        If the node can't be asked, the nonce is released anyway; should it
+        turn out to be used, the next send with it fails and it is checked again.
+        """
+        try:
+            used = w3.eth.get_transaction_count(self.address, "pending") > nonce
+        except Exception:
+            used = False
+        if used:
+            return
+        with self._lock:
+            heapq.heappush(self._released, nonce)
+        logger.warning("Nonce %s for %s released for reuse.", nonce, self.address)
+
+# The contract function, signing account, nonce counter and chain id are set
+# up once at startup. With coincurve installed, eth-account signs through
+# libsecp256k1. None of this is needed while settlement is simulated.
+if ONCHAIN_SETTLEMENT:
+    # Look up the contract function once instead of on every settlement.
+    settle_trade_fn = settlement_contract.functions.settleTrade
+    settlement_account = w3.eth.account.from_key(PRIVATE_KEY)
+    nonce_manager = NonceManager(settlement_account.address)
+    nonce_manager.sync()
+    CHAIN_ID = w3.eth.chain_id
+    logger.info("On-chain settlement enabled. Sending from %s on chain %s.", settlement_account.address, CHAIN_ID)
+
+class InvalidTradeError(ValueError):
+    """
+    Raised when a decoded trade has values that can never be settled.
+    Such messages are dropped instead of being requeued.
+    """
+
+class Trade(msgspec.Struct):
+    """
+    Schema of a trade settlement message. Price and amount are decoded
+    exactly as decimals, whether the producer sends them as JSON strings
+    or numbers.
+    """
+    trade_id: str
+    buyer_user_id: str
+    seller_user_id: str
+    price: Decimal
+    amount: Decimal
+
+# Decodes message bodies straight from bytes into `Trade`, validating the
+# fields in the same pass.
+trade_decoder = msgspec.json.Decoder(Trade)
+
+def to_wei(value: Decimal) -> int:
+    """
+    Converts a decimal price or amount into an integer wei value.
+    msgspec accepts "NaN", "Infinity", negative and arbitrarily large numbers
+    for Decimal fields, but the contract only takes positive uint256 values, so
+    anything else is rejected. Fractions of a wei are truncated.
+    """
+    if not (value.is_finite() and value > 0):
+        raise InvalidTradeError(f"Price and amount must be positive finite numbers, got {value}")
+    try:
+        scaled = value.scaleb(WEI_DECIMALS, context=WEI_CONTEXT)
+    except DecimalException as e:
+        # E.g. decimal.Overflow for "1e999999999".
+        raise InvalidTradeError(f"Value {value} can't be converted to wei: {e!r}") from e
+    # Check the magnitude first, so huge values are never turned into an int.
+    if scaled.adjusted() > 77 or int(scaled) > MAX_UINT256:
+        raise InvalidTradeError(f"Value {value} does not fit in a uint256 in wei")
+    wei = int(scaled)
+    if wei <= 0:
+        raise InvalidTradeError(f"Value {value} is smaller than one wei")
+    return wei
+
+async def decode_message(body: bytes) -> Trade:
+    """
+    Decodes a trade message body, offloading large bodies to a worker thread.
+    """
+    if len(body) > LARGE_MESSAGE_BYTES:
+        return await asyncio.to_thread(trade_decoder.decode, body)
+    return trade_decoder.decode(body)
+
+# Counter used to build mock transaction hashes while settlement is simulated.
+_tx_counter = count()
+
+# Worker threads for the blocking web3 calls, one per concurrent settlement.
+# Up to this many threads hold a nonce at the same time, which is why a failed
+# send releases only its own nonce instead of resetting the shared counter.
+settlement_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SETTLEMENTS, thread_name_prefix="settlement")
+
+def get_fee_fields() -> dict:
+    """
+    Returns the EIP-1559 fee fields for a settlement transaction, from the
+    config if both are set, otherwise from the node.
+    """
+    if SETTLEMENT_MAX_FEE_PER_GAS and SETTLEMENT_MAX_PRIORITY_FEE_PER_GAS:
+        return {
+            "maxFeePerGas": int(SETTLEMENT_MAX_FEE_PER_GAS),
+            "maxPriorityFeePerGas": int(SETTLEMENT_MAX_PRIORITY_FEE_PER_GAS),
+        }
+    priority_fee = w3.eth.max_priority_fee
+    base_fee = w3.eth.get_block("latest")["baseFeePerGas"]
+    # Same default as web3: room for the base fee to double before the transaction is mined.
+    return {"maxFeePerGas": 2 * base_fee + priority_fee, "maxPriorityFeePerGas": priority_fee}
+
+def settle_on_chain(trade_id: str, buyer_address: str, seller_address: str, price: int, amount: int) -> str:
+    """
+    Builds, signs and sends a settleTrade transaction. Returns the transaction hash.
+    This makes blocking RPC calls, so run it in a worker thread (see `process_trade`).
+    """
+    # Fetch the fees before taking a nonce. With every field filled in,
+    # `build_transaction` makes no RPC calls of its own.
+    tx_fields = get_fee_fields()
+    nonce = nonce_manager.next()
+    try:
+        tx = settle_trade_fn(
+            trade_id,
+            Web3.to_checksum_address(buyer_address),
+            Web3.to_checksum_address(seller_address),
+            price,
+            amount,
+        ).build_transaction({
+            "from": settlement_account.address,
+            "nonce": nonce,
+            "gas": SETTLEMENT_GAS_LIMIT,
+            "chainId": CHAIN_ID,
+            **tx_fields,
+        })
+        signed = settlement_account.sign_transaction(tx)
+        tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
+    except Exception:
+        # Hand the nonce back so it doesn't leave a gap for later transactions.
+        nonce_manager.release_if_unused(nonce)
+        raise
+    return w3.to_hex(tx_hash)
+
+def get_receipt(tx_hash: str):
+    """
+    Returns the receipt of a transaction, or None while it is still pending.
+    This makes a blocking RPC call, so run it in a worker thread.
+    """
+    try:
+        return w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        return None
+
+# Confirmation tasks that are still waiting for a receipt. Keeping a reference
+# stops them from being garbage collected while they run.
+_pending_confirmations = set()
+
+async def confirm_settlement(trade_id: str, tx_hash: str):
+    """
+    Waits for a submitted settlement transaction to be mined and checks its status.
+    The gas limit is fixed, so a settleTrade that reverts (e.g. "Trade already
+    settled" on a redelivered message, a missing allowance or a wrong owner) is
+    still mined and only shows up here as a failed receipt. The message has
+    already been acknowledged by then, so reverted trades are logged, not retried.
+    Confirmations still pending when the worker stops are not checked.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SETTLEMENT_RECEIPT_TIMEOUT
+    while True:
+        try:
+            receipt = await loop.run_in_executor(settlement_executor, get_receipt, tx_hash)
+        except Exception as e:
+            # Keep polling on RPC errors; the node may be briefly unavailable.
+            logger.warning("Error fetching receipt for TX %s of trade %s: %s", tx_hash, trade_id, e)
+            receipt = None
+        if receipt is not None:
+            break
+        if loop.time() >= deadline:
+            logger.error("TX %s for trade %s was not mined within %s seconds. Settlement unconfirmed.", tx_hash, trade_id, SETTLEMENT_RECEIPT_TIMEOUT)
+            return
+        await asyncio.sleep(SETTLEMENT_RECEIPT_POLL_INTERVAL)
+
+    if receipt["status"] != 1:
+        logger.error("TX %s for trade %s reverted in block %s. Trade NOT settled.", tx_hash, trade_id, receipt["blockNumber"])
+        return
+
+    # Example: Update a database.
+    # In a production environment, this is where you would update your off-chain
+    # database to record the successful settlement and the transaction hash.
+    logger.info("Trade %s settled on-chain in block %s with TX: %s", trade_id, receipt["blockNumber"], tx_hash)
+
 # --- RabbitMQ Message Consumer Logic ---
+# Limits how many messages are processed concurrently. With a prefetch count
+# above one, aio_pika runs the callback for each delivered message as its own task.
+settlement_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SETTLEMENTS)
+
 async def on_message(message: aio_pika.IncomingMessage):
     """
     Callback function to process incoming messages from the RabbitMQ queue.
     This function is triggered automatically when a new message is received.
     """
-    logger.debug(f"Received raw message: {message.body.decode()}")
+    async with settlement_semaphore:
+        await process_trade(message)
+
+async def process_trade(message: aio_pika.IncomingMessage):
+    """
+    Settles the trade contained in a single message and acknowledges it.
+    """
+    logger.debug("Received raw message: %s", message.body)
     # Use a context manager to automatically acknowledge the message upon successful processing.
     async with message.process():
         try:
-            # Decode the message body (byte string) into a JSON object (dictionary).
-            trade_data = json.loads(message.body.decode())
-            logger.info(f"Received trade for settlement: {trade_data}")
+            # Decode and validate the message body (byte string) into a `Trade`.
+            trade = await decode_message(message.body)
+            logger.info("Received trade for settlement: %s", trade)
 
             # Extract key data points from the trade message.
-            trade_id = trade_data.get("trade_id")
-            buyer_address = trade_data.get("buyer_user_id")
-            seller_address = trade_data.get("seller_user_id")
-            
-            # Convert float values for price and amount into integer wei values.
-            # Wei is the smallest unit of Ether (1 ETH = 10^18 wei),
-            # which is required for accurate on-chain calculations.
-            price = int(trade_data.get("price") * (10**18)) 
-            amount = int(trade_data.get("amount") * (10**18)) 
-
-            logger.debug(f"Parsed trade data - ID: {trade_id}, Buyer: {buyer_address}, Seller: {seller_address}, Price (wei): {price}, Amount (wei): {amount}")
-
-            # --- Mocking on-chain settlement for demonstration ---
-            # In a real system, you would call a function on the `settlement_contract`
-            # here, passing the trade details as parameters. This would involve
-            # building and signing a transaction.
-            # Example: settlement_contract.functions.settleTrade(trade_id, buyer_address, seller_address, price, amount).transact(...)
-            
-            # Generate a mock transaction hash to simulate a successful on-chain transaction.
-            tx_hash = f"0x{os.urandom(32).hex()}" 
-            logger.info(f"Simulated on-chain transaction with hash: {tx_hash} for trade {trade_id}")
-
-            # Example: Update a database.
-            # In a production environment, this is where you would update your off-chain
-            # database to record the successful settlement and the transaction hash.
-            logger.info(f"Trade {trade_id} marked as settled (simulated) with TX: {tx_hash}")
-
-        except json.JSONDecodeError:
-            # Handle cases where the message body is not valid JSON.
-            logger.error(f"Failed to decode JSON from message body: {message.body.decode()}", exc_info=True)
+            trade_id = trade.trade_id
+            buyer_address = trade.buyer_user_id
+            seller_address = trade.seller_user_id
+
+            # Convert price and amount into integer wei values, which is
+            # required for accurate on-chain calculations.
+            price = to_wei(trade.price)
+            amount = to_wei(trade.amount)
+
+            logger.debug("Parsed trade data - ID: %s, Buyer: %s, Seller: %s, Price (wei): %s, Amount (wei): %s", trade_id, buyer_address, seller_address, price, amount)
+
+            if ONCHAIN_SETTLEMENT:
+                # The buyer and seller ids must be addresses to settle on-chain.
+                # Anything else can never succeed, so it isn't retried.
+                if not (Web3.is_address(buyer_address) and Web3.is_address(seller_address)):
+                    raise InvalidTradeError(f"Buyer and seller must be Ethereum addresses, got {buyer_address} and {seller_address}")
+                # Call settleTrade on the `settlement_contract`, passing the trade
+                # details as parameters.
+                # The web3 calls block, so they run in a worker thread; the event loop
+                # stays free for other settlements and RabbitMQ heartbeats.
+                tx_hash = await asyncio.get_running_loop().run_in_executor(
+                    settlement_executor, settle_on_chain, trade_id, buyer_address, seller_address, price, amount
+                )
+                logger.info("Trade %s submitted on-chain with TX: %s. Waiting for the receipt.", trade_id, tx_hash)
+                # The receipt is checked in the background, so waiting for the
+                # transaction to be mined doesn't hold up this message or the worker.
+                task = asyncio.create_task(confirm_settlement(trade_id, tx_hash))
+                _pending_confirmations.add(task)
+                task.add_done_callback(_pending_confirmations.discard)
+            else:
+                # --- Mocking on-chain settlement for demonstration ---
+                # Generate a mock transaction hash to simulate a successful on-chain transaction.
+                tx_hash = f"0x{next(_tx_counter):064x}"
+                logger.info("Simulated on-chain transaction with hash: %s for trade %s", tx_hash, trade_id)
+
+                # Example: Update a database.
+                # In a production environment, this is where you would update your off-chain
+                # database to record the successful settlement and the transaction hash.
+                logger.info("Trade %s marked as settled (simulated) with TX: %s", trade_id, tx_hash)
+
+        except msgspec.DecodeError as e:
+            # Handle cases where the message body is not valid JSON, or a field
+            # is missing or has the wrong type (`msgspec.ValidationError`).
+            logger.error("Invalid trade message: %s. Message: %s", e, message.body, exc_info=True)
             # Acknowledge the message but do not requeue it, preventing an endless loop.
             await message.nack(requeue=False)
-        except KeyError as e:
-            # Handle cases where a required key is missing from the JSON data.
-            logger.error(f"Missing expected key in trade data: {e}. Message: {message.body.decode()}", exc_info=True)
+        except InvalidTradeError as e:
+            # Handle trades that can never be settled (e.g. a negative price, or a
+            # buyer or seller id that isn't an address when settling on-chain).
+            logger.error("Invalid trade data: %s. Message: %s", e, message.body, exc_info=True)
             await message.nack(requeue=False)
         except Exception as e:
             # Catch any other unexpected errors during processing.
-            logger.error(f"Error processing message or during on-chain settlement for message: {message.body.decode()}: {e}", exc_info=True)
+            logger.error("Error processing message or during on-chain settlement for message: %s: %s", message.body, e, exc_info=True)
             # Requeue the message for a later retry, as the error might be temporary (e.g., network issue).
             await message.nack(requeue=True) 
 
 # --- Consumer Main Function ---
-async def start_consumer():
+def on_reconnect(connection):
     """
-    Connects to RabbitMQ and sets up the consumer.
+    Called by the robust connection after it has reconnected to RabbitMQ.
+    The robust channel restores the QoS setting, the queue declaration and the
+    consumer on its own, so there is nothing to declare again here.
+    """
+    logger.warning("Reconnected to RabbitMQ. Channel topology and consumer restored.")
+
+async def init_rabbit():
     """
-    logger.info(f"Attempting to connect to RabbitMQ at: {RABBITMQ_URI}")
+    Connects to RabbitMQ and declares the settlement queue.
+    This runs once at startup; the returned connection and queue are kept for
+    the lifetime of the worker.
+    """
+    logger.info("Attempting to connect to RabbitMQ at: %s", RABBITMQ_URI)
     try:
         # Establish a robust connection to RabbitMQ, which handles retries.
         connection = await aio_pika.connect_robust(RABBITMQ_URI)
         logger.info("Successfully connected to RabbitMQ.")
     except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}. Please check RABBITMQ_URI and availability.", exc_info=True)
+        logger.error("Failed to connect to RabbitMQ: %s. Please check RABBITMQ_URI and availability.", e, exc_info=True)
         exit(1)
 
+    connection.reconnect_callbacks.add(on_reconnect)
+
+    # Open a communication channel.
+    channel = await connection.channel()
+    logger.info("RabbitMQ channel opened.")
+
+    # Set Quality of Service (QoS) so several messages are in flight at once.
+    # Settlement is mostly waiting on the network, so processing messages
+    # concurrently keeps the worker busy; `settlement_semaphore` caps the load.
+    await channel.set_qos(prefetch_count=PREFETCH_COUNT)
+    logger.info("QoS set: prefetch_count=%s.", PREFETCH_COUNT)
+
+    # Declare the queue. If it doesn't exist, it will be created.
+    # `durable=True` ensures the queue survives a RabbitMQ restart.
+    queue = await channel.declare_queue(QUEUE_NAME, durable=True)
+    logger.info("Queue '%s' declared.", QUEUE_NAME)
+    return connection, queue
+
+async def run_consumer(queue: aio_pika.abc.AbstractQueue):
+    """
+    Consumes messages from an already declared queue until cancelled.
+    """
+    # Start consuming messages from the queue, using `on_message` as the callback.
+    await queue.consume(on_message)
+
+    logger.info("Settlement worker started. Waiting for messages...")
+    # Keep the consumer running indefinitely.
+    await asyncio.Future()
+
+async def start_consumer():
+    """
+    Sets up RabbitMQ once and runs the consumer.
+    """
+    connection = None
     try:
-        # Open a communication channel.
-        channel = await connection.channel()
-        logger.info("RabbitMQ channel opened.")
-        
-        # Set Quality of Service (QoS) to prefetch one message at a time. This ensures
-        # the worker doesn't get overwhelmed and only processes messages one by one.
-        await channel.set_qos(prefetch_count=1)
-        logger.info(f"QoS set: prefetch_count=1.")
-        
-        # Declare the queue. If it doesn't exist, it will be created.
-        # `durable=True` ensures the queue survives a RabbitMQ restart.
-        queue = await channel.declare_queue(QUEUE_NAME, durable=True)
-        logger.info(f"Queue '{QUEUE_NAME}' declared. Starting consumption.")
-        
-        # Start consuming messages from the queue, using `on_message` as the callback.
-        await queue.consume(on_message)
-        
-        logger.info("Settlement worker started. Waiting for messages...")
-        # Keep the consumer running indefinitely.
-        await asyncio.Future()
+        connection, queue = await init_rabbit()
+        await run_consumer(queue)
     except Exception as e:
-        logger.critical(f"Critical error during consumer startup: {e}", exc_info=True)
+        logger.critical("Critical error during consumer startup: %s", e, exc_info=True)
     finally:
         # Ensure the connection is closed cleanly when the consumer stops.
         if connection:
@@ -153,10 +479,16 @@ async def start_consumer():
 # --- Script Entry Point ---
 if __name__ == "__main__":
     logger.info("Starting settlement worker main execution.")
+    # Keep the worker on its own core (if WORKER_CORE is set).
+    pin_to_cores_from_env()
     try:
-        # Run the asynchronous consumer.
-        asyncio.run(start_consumer())
+        # Run the asynchronous consumer on uvloop, a faster drop-in
+        # replacement for the default asyncio event loop, when it is installed.
+        if uvloop is not None:
+            uvloop.run(start_consumer())
+        else:
+            asyncio.run(start_consumer())
     except KeyboardInterrupt:
         logger.info("Settlement worker stopped by user (KeyboardInterrupt).")
     except Exception as e:
-        logger.critical(f"Unhandled exception in main execution: {e}", exc_info=True)
\ No newline at end of file
+        logger.critical("Unhandled exception in main execution: %s", e, exc_info=True)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { ethers, JsonRpcProvider } from 'ethers';
+import { decode } from '@msgpack/msgpack';
 import OrderBook from './components/OrderBook';
 import TradeForm from './components/TradeForm';
 
@@ -8,6 +9,17 @@ interface OrderBookData {
   asks: { price: number; amount: number }[];
 }
 
+// Market data frames are msgpack encoded: "t" is the message type,
+// "b" and "a" are the bids and asks.
+interface MarketDataFrame {
+  t: number;
+  b: OrderBookData['bids'];
+  a: OrderBookData['asks'];
+}
+
+// Message type of an order book update frame.
+const MSG_ORDERBOOK_UPDATE = 1;
+
 // Extend the Window interface to include ethereum for MetaMask detection
 declare global {
   interface Window {
@@ -109,16 +121,20 @@ const App: React.FC = () => {
 
     // --- WebSocket Connection Setup ---
     // Replace with your actual WebSocket endpoint
-    const ws = new WebSocket('ws://localhost:8000/ws/market_data');
+    const ws = new WebSocket('ws://localhost:8000/ws/marketdata');
+    // Frames arrive as binary msgpack, so receive them as raw bytes.
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       console.log('WebSocket connection established.');
     };
 
     ws.onmessage = (event) => {
-      // Parse the incoming market data (assuming JSON string)
-      const data: OrderBookData = JSON.parse(event.data);
-      setOrderBook(data);
+      // Decode the incoming msgpack frame and keep only order book updates
+      const frame = decode(new Uint8Array(event.data)) as MarketDataFrame;
+      if (frame.t === MSG_ORDERBOOK_UPDATE) {
+        setOrderBook({ bids: frame.b, asks: frame.a });
+      }
     };
 
     ws.onclose = (event) => {